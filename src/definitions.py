@@ -12,8 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import re
+
 STDERR_FILE_DATA_TYPE = "plain/txt"
 
+# Send task-progress events while commands run. Celery worker heartbeats already
+# keep tasks alive, so this is only needed where the events are consumed.
+PROGRESS_EVENTS = os.getenv("OPENRELIK_DFINDEXEDDB_PROGRESS_EVENTS") == "1"
+
 LEVELDB_RECORD_TYPES = {
     "log": [
         "blocks",
@@ -32,19 +39,36 @@ LEVELDB_RECORD_TYPES = {
     ]
 }
 
+ALL_LEVELDB_RECORD_TYPES = tuple(sorted({
+    record_type
+    for record_types in LEVELDB_RECORD_TYPES.values()
+    for record_type in record_types
+}))
+
 LEVELDB_FILE_REGEX = {
-    "descriptor": r"^MANIFEST-[0-9]{6}$",
-    "ldb": r"[0-9]{6}\.ldb$",
-    "log": r"[0-9]{6}\.log$",
+    "descriptor": re.compile(r"^MANIFEST-[0-9]{6}$"),
+    "ldb": re.compile(r"[0-9]{6}\.ldb$"),
+    "log": re.compile(r"[0-9]{6}\.log$"),
 }
 
+# Single pattern classifying a LevelDB file name, the matching group name is the
+# dfleveldb subcommand.
+LEVELDB_CLASSIFIER = re.compile("|".join(
+    f"(?P<{subcommand}>{file_regex.pattern})"
+    for subcommand, file_regex in LEVELDB_FILE_REGEX.items()
+))
+
 CHROMIUM_FILE_REGEX = {
-    "ldb": r"[0-9]{6}\.ldb$",
-    "log": r"[0-9]{6}\.log$",
+    "ldb": re.compile(r"[0-9]{6}\.ldb$"),
+    "log": re.compile(r"[0-9]{6}\.log$"),
 }
 
-SAFARI_FILE_REGEX = r"^IndexedDB.sqlite3$"
-FIREFOX_FILE_REGEX = r"\.sqlite$"
+SAFARI_FILE_REGEX = re.compile(r"^IndexedDB.sqlite3$")
+FIREFOX_FILE_REGEX = re.compile(r"\.sqlite$")
+
+# Plain string equivalents of the regexes above, used for matching file names.
+SAFARI_NAME = "IndexedDB.sqlite3"
+FIREFOX_SUFFIX = ".sqlite"
 
 OUTPUT_TYPES_EXTENSIONS = {
     "json": {
@@ -60,3 +84,9 @@ OUTPUT_TYPES_EXTENSIONS = {
         "mime": "text/plain"
     }
 }
+
+# Output types keyed by their lowercased name, for case-insensitive lookups.
+OUTPUT_TYPES_EXTENSIONS_CI = {
+    output_type.lower(): output_config
+    for output_type, output_config in OUTPUT_TYPES_EXTENSIONS.items()
+}
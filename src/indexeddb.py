@@ -12,18 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import fcntl
 import os
-import re
+import queue
 import shutil
-import subprocess
-import time
 import uuid
+from typing import Iterator
 
 from openrelik_worker_common.file_utils import create_output_file
-from openrelik_worker_common.task_utils import create_task_result, get_input_files
+from openrelik_worker_common.task_utils import create_task_result
 
 from .app import celery
 from . import definitions
+from .utils import get_input_files_cached, run_commands
 
 
 # Task name used to register and route the task to the correct queue.
@@ -57,6 +59,196 @@ TASK_METADATA = {
 
 INTERVAL_SECONDS = 2
 
+# ioctl request number for cloning a file on copy-on-write filesystems (linux/fs.h).
+FICLONE = 0x40049409
+COPY_BUFSIZE = 1024 * 1024
+
+# tmpfs used to stage input files that have to be copied, and the maximum share of
+# its free space the staged files may take up.
+SHM_PATH = "/dev/shm"
+SHM_MAX_USAGE = 0.5
+
+# Emptied staging directories on tmpfs kept for reuse by later tasks in this worker.
+# Directories next to the output are always removed so none are left behind in a
+# workflow's output path.
+SCRATCH_POOL_SIZE = 4
+_SCRATCH_POOL = queue.Queue(maxsize=SCRATCH_POOL_SIZE)
+
+
+def _get_subcommand(browser_type: str, display_name: str) -> str | None:
+    """Get the dfindexeddb subcommand for an input file.
+
+    Args:
+        browser_type: The browser type the file is from.
+        display_name: The display name of the file.
+
+    Returns:
+        The subcommand, or None if the file is not supported.
+    """
+    if browser_type == "chromium":
+        for subcommand, file_regex in definitions.CHROMIUM_FILE_REGEX.items():
+            if file_regex.search(display_name):
+                return subcommand
+    elif (browser_type == "firefox" and
+          display_name.endswith(definitions.FIREFOX_SUFFIX)):
+        return "db"
+    elif (browser_type == "safari" and
+          display_name == definitions.SAFARI_NAME):
+        return "db"
+
+    print(f"Unsupported {browser_type} file type for {display_name}.")
+    return None
+
+
+def _staging_bases(output_path: str, input_paths: list[str]) -> list[str]:
+    """Pick the directory to stage each input file under.
+
+    Input files on the same filesystem as output_path are hard linked for free.
+    The others have to be copied, and if together they fit they are copied to
+    tmpfs to skip the disk writes.
+
+    Args:
+        output_path: Path to the output directory.
+        input_paths: Paths of the input files to stage.
+
+    Returns:
+        The directory to create the staging directory in, for each input file.
+    """
+    staging_bases = [output_path] * len(input_paths)
+    try:
+        output_device = os.stat(output_path).st_dev
+        shm_free = shutil.disk_usage(SHM_PATH).free
+    except OSError:
+        return staging_bases
+
+    copy_sizes = {}
+    for index, path in enumerate(input_paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stat.st_dev != output_device:
+            copy_sizes[index] = stat.st_size
+
+    if copy_sizes and sum(copy_sizes.values()) <= shm_free * SHM_MAX_USAGE:
+        for index in copy_sizes:
+            staging_bases[index] = SHM_PATH
+    return staging_bases
+
+
+def _acquire_scratch(staging_base: str) -> str:
+    """Get an empty staging directory, reusing a pooled one if possible.
+
+    Args:
+        staging_base: The directory to create the staging directory in.
+
+    Returns:
+        Path to the staging directory.
+    """
+    if staging_base == SHM_PATH:
+        while True:
+            try:
+                temp_dir = _SCRATCH_POOL.get_nowait()
+            except queue.Empty:
+                break
+            # Skip directories removed outside the worker, e.g. by tmpfs cleanup.
+            if os.path.isdir(temp_dir):
+                return temp_dir
+    # Staged evidence may sit on a shared tmpfs, so keep it private to the worker.
+    temp_dir = os.path.join(staging_base, uuid.uuid4().hex)
+    os.mkdir(temp_dir, 0o700)
+    return temp_dir
+
+
+def _release_scratch(temp_dir: str) -> None:
+    """Empty a staging directory and return it to the pool, or remove it.
+
+    Args:
+        temp_dir: Path to the staging directory.
+    """
+    if os.path.dirname(temp_dir) == SHM_PATH:
+        try:
+            for entry in os.scandir(temp_dir):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            _SCRATCH_POOL.put_nowait(temp_dir)
+            return
+        except (OSError, queue.Full):
+            pass
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def _scratch_dir(staging_base: str) -> Iterator[str]:
+    """Provide a staging directory that is released even if the task fails.
+
+    Args:
+        staging_base: The directory to create the staging directory in.
+
+    Yields:
+        Path to the staging directory.
+    """
+    temp_dir = _acquire_scratch(staging_base)
+    try:
+        yield temp_dir
+    finally:
+        _release_scratch(temp_dir)
+
+
+def _stage(src: str, dst: str) -> None:
+    """Stage a file at a new path as cheaply as the filesystem allows.
+
+    Tries, in order, a hard link, a copy-on-write clone, an in-kernel
+    copy_file_range and finally a buffered copy.
+
+    Args:
+        src: Path of the file to stage.
+        dst: Path to stage the file at. Must not exist.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            # A clone only works within a filesystem, where a hard link was just
+            # tried, and tmpfs does not support it. So this only helps when
+            # linking is refused, e.g. with EPERM under protected_hardlinks or
+            # EMLINK at the link limit.
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                return
+            except OSError:
+                pass
+
+            try:
+                while os.copy_file_range(src_fd, dst_fd, COPY_BUFSIZE):
+                    pass
+                return
+            except OSError:
+                # Discard any partial copy before falling back.
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+
+            with (
+                open(src_fd, "rb", closefd=False) as src_fh,
+                open(dst_fd, "wb", closefd=False) as dst_fh
+            ):
+                shutil.copyfileobj(src_fh, dst_fh, COPY_BUFSIZE)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
 
 @celery.task(bind=True, name=TASK_NAME, metadata=TASK_METADATA)
 def command(
@@ -79,8 +271,9 @@ def command(
     Returns:
         Base64-encoded dictionary containing task results.
     """
-    input_files = get_input_files(pipe_result, input_files or [])
+    input_files = get_input_files_cached(pipe_result, input_files or [])
     output_files = []
+    commands = []
     base_command = "dfindexeddb"
 
     if not task_config:
@@ -92,96 +285,89 @@ def command(
         )
 
     # parse task configuration
-    output_format = task_config.get("output_format", []).lower()
-    output_config = definitions.OUTPUT_TYPES_EXTENSIONS[output_format]
+    output_format = task_config.get("output_format", "").lower()
+    try:
+        output_config = definitions.OUTPUT_TYPES_EXTENSIONS_CI[output_format]
+    except KeyError:
+        raise RuntimeError(f"Unsupported output format {output_format}") from None
     output_extension = output_config["extension"]
     browser_type = task_config.get("browser_type", "")
 
-    # Create temporary directory and hard link files for processing
-    temp_dir = os.path.join(output_path, uuid.uuid4().hex)
-    os.mkdir(temp_dir)
-
-    input_files_temp = []
-    for input_file in input_files or []:
-        display_name = input_file.get("display_name")
-        temp_file = f"{temp_dir}/{display_name}"
-        shutil.copy(input_file.get("path"), temp_file)
-        input_files_temp.append((input_file, temp_file))
-
-    for input_file, temp_file in input_files_temp:
-        display_name = input_file.get("display_name")
-        original_path = input_file.get("path")
-        source_file_id = input_file.get("id")
-        data_type = f"openrelik:dfindexeddb:{browser_type}:{output_format}"
-        if browser_type == "chromium":
-            for subcommand, value in definitions.CHROMIUM_FILE_REGEX.items():
-                if re.search(value, display_name):
-                    break
-            else:
-                print(f"Unsupported {browser_type} file type for {display_name}.")
-                continue
-        elif (browser_type == "firefox" and
-              re.search(definitions.FIREFOX_FILE_REGEX, display_name)):
-            subcommand = "db"
-        elif (browser_type == "safari" and
-              re.search(definitions.SAFARI_FILE_REGEX, display_name)):
-            subcommand = "db"
-        else:
-            print(f"Unsupported {browser_type} file type for {display_name}.")
-            continue
-
-        stdout_file = create_output_file(
-            output_base_path=output_path,
-            display_name=f"{display_name}.{browser_type}",
-            extension=output_extension,
-            data_type=data_type,
-            original_path=original_path,
-            source_file_id=source_file_id
-        )
-        stderr_file = create_output_file(
-            output_base_path=output_path,
-            display_name=display_name,
-            extension=f"{output_extension}.error.txt",
-            data_type=definitions.STDERR_FILE_DATA_TYPE,
-            original_path=original_path,
-            source_file_id=source_file_id
-        )
+    # Select the supported input files before staging anything
+    supported_files = []
+    for input_file in input_files:
+        subcommand = _get_subcommand(browser_type, input_file.get("display_name"))
+        if subcommand:
+            supported_files.append((input_file, subcommand))
 
-        command_parts = [
-            base_command,
-            subcommand,
-            "-s",
-            temp_file,
-            "-o",
-            output_format
-        ]
-
-        if subcommand == "db":
-            command_parts.extend([
-                "--format",
-                browser_type,
-            ])
-
-        # Run the command
-        with (
-            open(stdout_file.path, "w", encoding="utf-8") as stdout_fh,
-            open(stderr_file.path, "w", encoding="utf-8") as stderr_fh
-        ):
-            process = subprocess.Popen(command_parts, stdout=stdout_fh, stderr=stderr_fh)
-            while process.poll() is None:
-                self.send_event("task-progress", data=None)
-                time.sleep(INTERVAL_SECONDS)
-
-        output_files.append(stdout_file.to_dict())
-        output_files.append(stderr_file.to_dict())
-
-    # Remove temp directory
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-
-    if not output_files:
+    if not supported_files:
         raise RuntimeError("No supported files")
 
+    # Create temporary directories and stage files for processing
+    staging_bases = _staging_bases(
+        output_path, [input_file.get("path") for input_file, _ in supported_files]
+    )
+    with contextlib.ExitStack() as stack:
+        temp_dirs = {
+            staging_base: stack.enter_context(_scratch_dir(staging_base))
+            for staging_base in dict.fromkeys(staging_bases)
+        }
+        for index, (input_file, subcommand) in enumerate(supported_files):
+            display_name = input_file.get("display_name")
+            original_path = input_file.get("path")
+            source_file_id = input_file.get("id")
+            data_type = f"openrelik:dfindexeddb:{browser_type}:{output_format}"
+            # Stage each file in its own subdirectory so files with the same
+            # name, e.g. from different Chromium origins, do not collide.
+            input_dir = f"{temp_dirs[staging_bases[index]]}/{index}"
+            os.mkdir(input_dir, 0o700)
+            temp_file = f"{input_dir}/{display_name}"
+            _stage(original_path, temp_file)
+
+            stdout_file = create_output_file(
+                output_base_path=output_path,
+                display_name=f"{display_name}.{browser_type}",
+                extension=output_extension,
+                data_type=data_type,
+                original_path=original_path,
+                source_file_id=source_file_id
+            )
+            stderr_file = create_output_file(
+                output_base_path=output_path,
+                display_name=display_name,
+                extension=f"{output_extension}.error.txt",
+                data_type=definitions.STDERR_FILE_DATA_TYPE,
+                original_path=original_path,
+                source_file_id=source_file_id
+            )
+
+            command_parts = [
+                base_command,
+                subcommand,
+                "-s",
+                temp_file,
+                "-o",
+                output_format
+            ]
+
+            if subcommand == "db":
+                command_parts.extend([
+                    "--format",
+                    browser_type,
+                ])
+
+            commands.append((command_parts, stdout_file.path, stderr_file.path))
+            output_files.append(stdout_file.to_dict())
+            output_files.append(stderr_file.to_dict())
+
+        # Run the commands
+        run_commands(
+            commands,
+            (lambda: self.send_event("task-progress", data=None))
+            if definitions.PROGRESS_EVENTS else None,
+            INTERVAL_SECONDS,
+        )
+
     return create_task_result(
         output_files=output_files,
         workflow_id=workflow_id,
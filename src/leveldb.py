@@ -12,15 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
-import subprocess
-import time
-
 from openrelik_worker_common.file_utils import create_output_file
-from openrelik_worker_common.task_utils import create_task_result, get_input_files
+from openrelik_worker_common.task_utils import create_task_result
 
 from .app import celery
 from . import definitions
+from .utils import get_input_files_cached, run_commands
 
 
 # Task name used to register and route the task to the correct queue.
@@ -37,11 +34,7 @@ TASK_METADATA = {
             "name": "record_type",
             "label": "Record Type",
             "description": "The record type to extract",
-            "items": set(
-                definitions.LEVELDB_RECORD_TYPES["descriptor"] +
-                definitions.LEVELDB_RECORD_TYPES["ldb"] +
-                definitions.LEVELDB_RECORD_TYPES["log"]
-            ),
+            "items": definitions.ALL_LEVELDB_RECORD_TYPES,
             "type": "select",
             "required": True,
         },
@@ -59,6 +52,27 @@ TASK_METADATA = {
 INTERVAL_SECONDS = 2
 
 
+def _get_subcommand(record_type: str, display_name: str) -> str | None:
+    """Get the dfleveldb subcommand for an input file.
+
+    Args:
+        record_type: The record type to extract.
+        display_name: The display name of the file.
+
+    Returns:
+        The subcommand, or None if the file or record type is not supported.
+    """
+    match = definitions.LEVELDB_CLASSIFIER.search(display_name)
+    if not match:
+        print(f"Unsupported file type for {display_name}.")
+        return None
+    subcommand = match.lastgroup
+    if record_type not in definitions.LEVELDB_RECORD_TYPES[subcommand]:
+        print(f"Unsupported record type {record_type} for {subcommand} file.")
+        return None
+    return subcommand
+
+
 @celery.task(bind=True, name=TASK_NAME, metadata=TASK_METADATA)
 def command(
     self,
@@ -80,8 +94,9 @@ def command(
     Returns:
         Base64-encoded dictionary containing task results.
     """
-    input_files = get_input_files(pipe_result, input_files or [])
+    input_files = get_input_files_cached(pipe_result, input_files or [])
     output_files = []
+    commands = []
     base_command = "dfleveldb"
 
     if not task_config:
@@ -94,25 +109,27 @@ def command(
 
     # parse task configuration
     output_format = task_config.get("output_format", "").lower()
-    output_config = definitions.OUTPUT_TYPES_EXTENSIONS[output_format]
+    try:
+        output_config = definitions.OUTPUT_TYPES_EXTENSIONS_CI[output_format]
+    except KeyError:
+        raise RuntimeError(f"Unsupported output format {output_format}") from None
     output_extension = output_config["extension"]
     record_type = task_config.get("record_type", "")
 
-    # parse input files
-    for input_file in input_files or []:
+    # Select the supported input files before creating any output
+    supported_files = []
+    for input_file in input_files:
+        subcommand = _get_subcommand(record_type, input_file.get("display_name"))
+        if subcommand:
+            supported_files.append((input_file, subcommand))
+
+    if not supported_files:
+        raise RuntimeError("No supported files")
+
+    for input_file, subcommand in supported_files:
         display_name = input_file.get("display_name")
         original_path = input_file.get("path")
         source_file_id = input_file.get("id")
-        for file_ext, file_regex in definitions.LEVELDB_FILE_REGEX.items():
-            if re.search(file_regex, display_name):
-                subcommand = file_ext
-                break
-        else:
-            print(f"Unsupported file type for {display_name}.")
-            continue
-        if record_type not in definitions.LEVELDB_RECORD_TYPES[subcommand]:
-            print(f"Unsupported record type {record_type} for {subcommand} file.")
-            continue
         data_type = f"openrelik:dfleveldb:{record_type}:{output_format}"
 
         stdout_file = create_output_file(
@@ -142,21 +159,17 @@ def command(
             output_format
         ]
 
-        # Run the command
-        with (
-            open(stdout_file.path, "w", encoding="utf-8") as stdout_fh,
-            open(stderr_file.path, "w", encoding="utf-8") as stderr_fh
-        ):
-            process = subprocess.Popen(command_parts, stdout=stdout_fh, stderr=stderr_fh)
-            while process.poll() is None:
-                self.send_event("task-progress", data=None)
-                time.sleep(INTERVAL_SECONDS)
-
+        commands.append((command_parts, stdout_file.path, stderr_file.path))
         output_files.append(stdout_file.to_dict())
         output_files.append(stderr_file.to_dict())
 
-    if not output_files:
-        raise RuntimeError("No supported files")
+    # Run the commands
+    run_commands(
+        commands,
+        (lambda: self.send_event("task-progress", data=None))
+        if definitions.PROGRESS_EVENTS else None,
+        INTERVAL_SECONDS,
+    )
 
     return create_task_result(
         output_files=output_files,
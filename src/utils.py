@@ -0,0 +1,191 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Helper methods shared by the dfindexeddb tasks."""
+
+import collections
+import functools
+import os
+import selectors
+import subprocess
+import time
+from typing import Callable
+
+from openrelik_worker_common.task_utils import get_input_files
+
+
+OUTPUT_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+
+# Initial delay between polls of commands that cannot be waited on via a pidfd.
+MIN_POLL_SECONDS = 0.01
+
+
+def _close_output_fds(output_fds: tuple[int, ...]) -> None:
+    """Hint that written output can leave the page cache and close the descriptors.
+
+    The worker never reads the output back, so keeping it cached only evicts
+    pages other tasks could use. This is best-effort: the output has just been
+    written, and Linux only starts writeback for dirty pages on
+    POSIX_FADV_DONTNEED and leaves them cached, so mostly already clean pages
+    are dropped. The output is not synced first, as that would stall the loop
+    driving the other commands.
+
+    Args:
+        output_fds: File descriptors to close.
+    """
+    for fd in output_fds:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+        os.close(fd)
+
+
+@functools.lru_cache(maxsize=16)
+def _decode_pipe_result(pipe_result: str) -> tuple[dict, ...]:
+    """Decode the input files from a previous task result, memoized."""
+    return tuple(get_input_files(pipe_result, []))
+
+
+def get_input_files_cached(pipe_result: str | None, input_files: list) -> list:
+    """Prepare the input files for the task, reusing decoded pipe results.
+
+    A piped result replaces input_files entirely, so decoded results are cached
+    by pipe_result alone and shared by tasks fanned out from the same result.
+
+    Args:
+        pipe_result: Base64-encoded result from the previous Celery task, if any.
+        input_files: List of input file dictionaries.
+
+    Returns:
+        A list of input file dictionaries, copied from the cache so callers
+        can modify them.
+    """
+    if isinstance(pipe_result, str):
+        return [dict(input_file) for input_file in _decode_pipe_result(pipe_result)]
+    return get_input_files(pipe_result, input_files)
+
+
+class _ProgressThrottle:
+    """Coalesces heartbeat calls into at most one per interval."""
+
+    def __init__(self, heartbeat: Callable[[], None], interval: float):
+        self._heartbeat = heartbeat
+        self._interval = interval
+        self._last_emit = time.monotonic()
+
+    def timeout(self) -> float:
+        """Returns the number of seconds until the next heartbeat is due."""
+        return max(0.0, self._last_emit + self._interval - time.monotonic())
+
+    def __call__(self) -> None:
+        now = time.monotonic()
+        if now - self._last_emit >= self._interval:
+            self._heartbeat()
+            self._last_emit = now
+
+
+def run_commands(
+    commands: list[tuple[list[str], str, str]],
+    heartbeat: Callable[[], None] | None,
+    interval: float,
+    max_workers: int | None = None,
+) -> list[int]:
+    """Run commands concurrently, writing their output to files.
+
+    Each running command is watched through a pidfd so it is reaped as soon as
+    it exits and the next pending command can start. Without a heartbeat the
+    worker sleeps until a command exits. On platforms without pidfd_open the
+    running commands are polled instead, backing off from MIN_POLL_SECONDS to
+    interval seconds between polls.
+
+    Args:
+        commands: List of (command_parts, stdout_path, stderr_path) tuples.
+        heartbeat: Called at most once every interval seconds while commands
+            run, regardless of how many run at once. None to disable.
+        interval: Number of seconds between heartbeats.
+        max_workers: Maximum number of commands to run at once. Defaults to
+            the number of CPUs.
+
+    Returns:
+        The exit codes of the commands, in the order they were given.
+    """
+    throttle = _ProgressThrottle(heartbeat, interval) if heartbeat is not None else None
+    returncodes = [None] * len(commands)
+    pending = collections.deque(enumerate(commands))
+    running = {}
+    poll_delay = MIN_POLL_SECONDS
+    max_workers = max(1, min(len(commands), max_workers or os.cpu_count() or 1))
+
+    with selectors.DefaultSelector() as selector:
+        try:
+            while pending or running:
+                while pending and len(running) < max_workers:
+                    index, (command_parts, stdout_path, stderr_path) = pending.popleft()
+                    # The child writes straight to the files, so hand it raw
+                    # descriptors. They stay open until it exits so the written
+                    # pages can be dropped from the page cache.
+                    output_fds = (
+                        os.open(stdout_path, OUTPUT_FLAGS, 0o644),
+                        os.open(stderr_path, OUTPUT_FLAGS, 0o644),
+                    )
+                    try:
+                        process = subprocess.Popen(
+                            command_parts, stdout=output_fds[0], stderr=output_fds[1]
+                        )
+                    except BaseException:
+                        _close_output_fds(output_fds)
+                        raise
+                    try:
+                        pidfd = os.pidfd_open(process.pid)
+                    except (AttributeError, OSError):
+                        pidfd = None
+                    else:
+                        selector.register(pidfd, selectors.EVENT_READ)
+                    running[index] = (process, pidfd, output_fds)
+
+                finished = [
+                    index for index, (process, _, _) in running.items()
+                    if process.poll() is not None
+                ]
+                for index in finished:
+                    process, pidfd, output_fds = running.pop(index)
+                    if pidfd is not None:
+                        selector.unregister(pidfd)
+                        os.close(pidfd)
+                    _close_output_fds(output_fds)
+                    returncodes[index] = process.returncode
+
+                if finished:
+                    poll_delay = MIN_POLL_SECONDS
+                elif running:
+                    timeout = throttle.timeout() if throttle is not None else None
+                    if len(selector.get_map()) < len(running):
+                        # Back off exponentially while polling commands without a
+                        # pidfd, so short commands are reaped quickly.
+                        if timeout is None or poll_delay < timeout:
+                            timeout = poll_delay
+                        poll_delay = min(poll_delay * 2, interval)
+                    selector.select(timeout=timeout)
+                if throttle is not None:
+                    throttle()
+        finally:
+            for process, pidfd, output_fds in running.values():
+                process.kill()
+                process.wait()
+                if pidfd is not None:
+                    os.close(pidfd)
+                _close_output_fds(output_fds)
+
+    return returncodes
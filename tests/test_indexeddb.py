@@ -14,13 +14,22 @@
 # limitations under the License.
 """Unit tests for OpenRelik indexeddb task."""
 import os
+import shutil
+import stat
 import tempfile
 import unittest
 from unittest import mock
 
 
 with mock.patch.dict(os.environ, {"REDIS_URL": "redis://"}, clear=True):
-    from src.indexeddb import command
+    from src.indexeddb import (
+        _acquire_scratch,
+        _release_scratch,
+        _scratch_dir,
+        _stage,
+        _staging_bases,
+        command,
+    )
 
 
 class IndexedDBTest(unittest.TestCase):
@@ -49,11 +58,68 @@ class IndexedDBTest(unittest.TestCase):
             result.get()
         self.assertEqual(result.status, "FAILURE")
 
+    @mock.patch("src.indexeddb._stage")
+    def test_unsupported_input_files(self, mock_stage):
+        """Tests unsupported input files fail before staging."""
+        input_files = [
+            {
+                "id": 1,
+                "display_name": "000005.ldb",
+                "path": "./test_data/leveldb/000005.ldb"
+            }
+        ]
+        task_config = {
+            "browser_type": "firefox",
+            "output_format": "JSONL"
+        }
+
+        with tempfile.TemporaryDirectory() as output_path:
+            result = command.s(
+                pipe_result=None,
+                input_files=input_files,
+                output_path=output_path,
+                workflow_id="fake_workflow_id",
+                task_config=task_config
+            ).apply()
+
+            with self.assertRaisesRegex(RuntimeError, "No supported files"):
+                result.get()
+            self.assertEqual(os.listdir(output_path), [])
+        mock_stage.assert_not_called()
+
+    @mock.patch("src.indexeddb._stage", side_effect=OSError("fake error"))
+    def test_staging_failure(self, mock_stage):
+        """Tests the staging directory is removed when staging fails."""
+        input_files = [
+            {
+                "id": 1,
+                "display_name": "fake_firefox.sqlite",
+                "path": "./test_data/indexeddb/fake_firefox.sqlite"
+            }
+        ]
+        task_config = {
+            "browser_type": "firefox",
+            "output_format": "JSONL"
+        }
+
+        with tempfile.TemporaryDirectory() as output_path:
+            result = command.s(
+                pipe_result=None,
+                input_files=input_files,
+                output_path=output_path,
+                workflow_id="fake_workflow_id",
+                task_config=task_config
+            ).apply()
+
+            with self.assertRaisesRegex(OSError, "fake error"):
+                result.get()
+            self.assertEqual(os.listdir(output_path), [])
+
     @mock.patch("uuid.uuid4")
-    @mock.patch("src.indexeddb.shutil.copy")
+    @mock.patch("src.indexeddb.os.link")
     @mock.patch("subprocess.Popen")
     @mock.patch("celery.result")
-    def test_input_files(self, mock_result, mock_popen, mock_copy, mock_uuid):
+    def test_input_files(self, mock_result, mock_popen, mock_link, mock_uuid):
         """Tests a single input file."""
         mock_uuid.return_value.hex = "test_uuid"
         pipe_result = None
@@ -86,13 +152,151 @@ class IndexedDBTest(unittest.TestCase):
         mock_popen.assert_called_once_with(
             [
                 "dfindexeddb", "db",
-                "-s", f"{output_path}/test_uuid/fake_firefox.sqlite",
+                "-s", f"{output_path}/test_uuid/0/fake_firefox.sqlite",
                 "-o", "jsonl",
                 "--format", "firefox"
             ],
             stdout=mock.ANY, stderr=mock.ANY
         )
 
+    @mock.patch("uuid.uuid4")
+    @mock.patch("subprocess.Popen")
+    @mock.patch("celery.result")
+    def test_input_files_same_name(self, mock_result, mock_popen, mock_uuid):
+        """Tests input files with the same name from different origins."""
+        mock_uuid.return_value.hex = "test_uuid"
+        task_config = {
+            "browser_type": "chromium",
+            "output_format": "JSONL"
+        }
+
+        with tempfile.TemporaryDirectory() as output_path:
+            input_files = []
+            for index, origin in enumerate(("origin_a", "origin_b")):
+                os.mkdir(os.path.join(output_path, origin))
+                path = os.path.join(output_path, origin, "000003.log")
+                with open(path, "wb") as fh:
+                    fh.write(b"fake_log_data")
+                input_files.append(
+                    {"id": index, "display_name": "000003.log", "path": path}
+                )
+
+            result = command.s(
+                pipe_result=None,
+                input_files=input_files,
+                output_path=output_path,
+                workflow_id="fake_workflow_id",
+                task_config=task_config
+            ).apply()
+
+            _ = result.get()
+        self.assertEqual(result.status, "SUCCESS")
+        self.assertEqual(
+            [call.args[0][3] for call in mock_popen.call_args_list],
+            [
+                f"{output_path}/test_uuid/0/000003.log",
+                f"{output_path}/test_uuid/1/000003.log",
+            ]
+        )
+
+    @mock.patch("src.indexeddb.os.link", side_effect=OSError)
+    def test_stage_fallback(self, mock_link):
+        """Tests staging a file when hard linking is not possible."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            src = os.path.join(temp_dir, "src.sqlite")
+            dst = os.path.join(temp_dir, "dst.sqlite")
+            with open(src, "wb") as fh:
+                fh.write(b"fake_sqlite_data")
+
+            _stage(src, dst)
+
+            with open(dst, "rb") as fh:
+                self.assertEqual(fh.read(), b"fake_sqlite_data")
+        mock_link.assert_called_once_with(src, dst)
+
+    def test_stage_existing_destination(self):
+        """Tests staging to an existing path is not retried with a copy."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            src = os.path.join(temp_dir, "src.sqlite")
+            dst = os.path.join(temp_dir, "dst.sqlite")
+            for path in (src, dst):
+                with open(path, "wb") as fh:
+                    fh.write(b"fake_sqlite_data")
+
+            with self.assertRaises(FileExistsError):
+                _stage(src, dst)
+
+    def test_staging_base(self):
+        """Tests staging next to the output when files can be hard linked."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            src = os.path.join(temp_dir, "src.sqlite")
+            with open(src, "wb") as fh:
+                fh.write(b"fake_sqlite_data")
+
+            self.assertEqual(_staging_bases(temp_dir, [src]), [temp_dir])
+
+    @mock.patch("src.indexeddb.shutil.disk_usage")
+    @mock.patch("src.indexeddb.os.stat")
+    def test_staging_base_shm(self, mock_stat, mock_disk_usage):
+        """Tests staging only the files that have to be copied on tmpfs."""
+        mock_stat.side_effect = [
+            mock.Mock(st_dev=1),
+            mock.Mock(st_dev=1, st_size=900),
+            mock.Mock(st_dev=2, st_size=100),
+        ]
+        mock_disk_usage.return_value.free = 1000
+
+        self.assertEqual(
+            _staging_bases(
+                "/fake/output", ["/fake/linked.sqlite", "/fake/copied.sqlite"]
+            ),
+            ["/fake/output", "/dev/shm"]
+        )
+
+    def test_scratch_pool(self):
+        """Tests staging directories on tmpfs are emptied and reused."""
+        with tempfile.TemporaryDirectory() as shm_path:
+            with mock.patch("src.indexeddb.SHM_PATH", shm_path):
+                temp_dir = _acquire_scratch(shm_path)
+                os.mkdir(os.path.join(temp_dir, "0"))
+                with open(os.path.join(temp_dir, "0", "fake.sqlite"), "wb") as fh:
+                    fh.write(b"fake_sqlite_data")
+                _release_scratch(temp_dir)
+
+                self.assertEqual(_acquire_scratch(shm_path), temp_dir)
+                self.assertEqual(os.listdir(temp_dir), [])
+
+    def test_scratch_pool_stale(self):
+        """Tests pooled staging directories removed externally are skipped."""
+        with tempfile.TemporaryDirectory() as shm_path:
+            with mock.patch("src.indexeddb.SHM_PATH", shm_path):
+                temp_dir = _acquire_scratch(shm_path)
+                _release_scratch(temp_dir)
+                os.rmdir(temp_dir)
+
+                with _scratch_dir(shm_path) as new_temp_dir:
+                    self.assertNotEqual(new_temp_dir, temp_dir)
+                    self.assertTrue(os.path.isdir(new_temp_dir))
+                    # Removed again before release, which must not raise.
+                    shutil.rmtree(new_temp_dir)
+
+    @mock.patch("src.indexeddb.os.link", side_effect=OSError)
+    def test_scratch_permissions(self, mock_link):
+        """Tests staged copies on tmpfs are only accessible by the worker."""
+        with tempfile.TemporaryDirectory() as shm_path:
+            src = os.path.join(shm_path, "src.sqlite")
+            with open(src, "wb") as fh:
+                fh.write(b"fake_sqlite_data")
+
+            with mock.patch("src.indexeddb.SHM_PATH", shm_path):
+                temp_dir = _acquire_scratch(shm_path)
+                dst = os.path.join(temp_dir, "dst.sqlite")
+                _stage(src, dst)
+
+                self.assertEqual(stat.S_IMODE(os.stat(temp_dir).st_mode), 0o700)
+                self.assertEqual(stat.S_IMODE(os.stat(dst).st_mode), 0o600)
+                shutil.rmtree(temp_dir)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for OpenRelik leveldb task."""
+import json
 import os
 import tempfile
 import unittest
@@ -20,7 +21,7 @@ from unittest import mock
 
 
 with mock.patch.dict(os.environ, {"REDIS_URL": "redis://"}, clear=True):
-    from src.leveldb import command
+    from src.leveldb import TASK_METADATA, command
 
 
 class LevelDBTest(unittest.TestCase):
@@ -90,6 +91,36 @@ class LevelDBTest(unittest.TestCase):
             stdout=mock.ANY, stderr=mock.ANY
         )
 
+    def test_unsupported_output_format(self):
+        """Tests an unsupported output format."""
+        task_config = {
+            "record_type": "blocks",
+            "output_format": "XML"
+        }
+
+        result = command.s(
+            pipe_result=None,
+            input_files=[],
+            output_path="/fake/path",
+            workflow_id="fake_workflow_id",
+            task_config=task_config
+        ).apply()
+
+        with self.assertRaisesRegex(RuntimeError, "Unsupported output format xml"):
+            result.get()
+        self.assertEqual(result.status, "FAILURE")
+
+    def test_task_metadata(self):
+        """Tests the task metadata is JSON serializable."""
+        metadata = json.loads(json.dumps(TASK_METADATA))
+        self.assertEqual(
+            metadata["task_config"][0]["items"],
+            [
+                "blocks", "parsed_internal_key", "physical_records",
+                "records", "versionedit", "write_batches"
+            ]
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for OpenRelik dfindexeddb task helpers."""
+import base64
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from openrelik_worker_common.task_utils import get_input_files
+
+from src.utils import (
+    _decode_pipe_result,
+    _ProgressThrottle,
+    get_input_files_cached,
+    run_commands,
+)
+
+
+class UtilsTest(unittest.TestCase):
+    """Unit tests for the OpenRelik dfindexeddb task helpers."""
+
+    def test_run_commands(self):
+        """Tests running commands concurrently."""
+        heartbeat = mock.Mock()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            commands = []
+            for index in range(3):
+                commands.append((
+                    [
+                        sys.executable, "-c",
+                        f"import time; time.sleep(0.2); print({index}); exit({index})"
+                    ],
+                    os.path.join(temp_dir, f"{index}.out"),
+                    os.path.join(temp_dir, f"{index}.err"),
+                ))
+
+            returncodes = run_commands(commands, heartbeat, 0.05, max_workers=2)
+
+            for index, (_, stdout_path, stderr_path) in enumerate(commands):
+                with open(stdout_path, encoding="utf-8") as fh:
+                    self.assertEqual(fh.read(), f"{index}\n")
+                self.assertTrue(os.path.exists(stderr_path))
+        self.assertEqual(returncodes, [0, 1, 2])
+        self.assertTrue(heartbeat.called)
+
+    @mock.patch("src.utils.os.pidfd_open", side_effect=OSError)
+    def test_run_commands_fallback(self, mock_pidfd_open):
+        """Tests running commands without pidfd support."""
+        heartbeat = mock.Mock()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            commands = [(
+                [sys.executable, "-c", "exit(3)"],
+                os.path.join(temp_dir, "out"),
+                os.path.join(temp_dir, "err"),
+            )]
+
+            returncodes = run_commands(commands, heartbeat, 60)
+
+        self.assertEqual(returncodes, [3])
+        mock_pidfd_open.assert_called_once()
+        heartbeat.assert_not_called()
+
+    def test_run_commands_without_heartbeat(self):
+        """Tests running commands without progress heartbeats."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            commands = [(
+                [sys.executable, "-c", "import time; time.sleep(0.1)"],
+                os.path.join(temp_dir, "out"),
+                os.path.join(temp_dir, "err"),
+            )]
+
+            returncodes = run_commands(commands, None, 0.05)
+
+        self.assertEqual(returncodes, [0])
+
+    @mock.patch("src.utils.time.monotonic")
+    def test_progress_throttle(self, mock_monotonic):
+        """Tests heartbeats are coalesced to one per interval."""
+        heartbeat = mock.Mock()
+        mock_monotonic.return_value = 100.0
+        throttle = _ProgressThrottle(heartbeat, 2)
+
+        for now in (100.5, 101.0, 102.0, 102.5, 103.9, 104.0):
+            mock_monotonic.return_value = now
+            throttle()
+
+        self.assertEqual(heartbeat.call_count, 2)
+        self.assertEqual(throttle.timeout(), 2.0)
+
+    @mock.patch("src.utils.get_input_files", wraps=get_input_files)
+    def test_get_input_files_cached(self, mock_get_input_files):
+        """Tests piped input files are decoded once."""
+        _decode_pipe_result.cache_clear()
+        output_files = [{"id": 1, "display_name": "000005.ldb"}]
+        pipe_result = base64.b64encode(
+            json.dumps({"output_files": output_files}).encode("utf-8")
+        ).decode("utf-8")
+
+        for _ in range(2):
+            input_files = get_input_files_cached(pipe_result, [])
+            self.assertEqual(input_files, output_files)
+            input_files[0]["display_name"] = "modified"
+
+        mock_get_input_files.assert_called_once_with(pipe_result, [])
+
+
+if __name__ == "__main__":
+    unittest.main()